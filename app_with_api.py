@@ -9,16 +9,22 @@ Usage:
 3. Run: python app_with_api.py
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, stream_with_context
 import json
 import os
+import re
 import base64
+import hashlib
+import secrets
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 from datetime import datetime
 from dotenv import load_dotenv
-import pdfplumber
-from openai import OpenAI
-import httpx
+
+# pdfplumber, openai and httpx are imported on first use to keep worker startup fast
 
 # Load environment variables (override=True ensures .env takes precedence)
 load_dotenv(override=True)
@@ -32,17 +38,34 @@ app.secret_key = os.getenv('SECRET_KEY', 'finsight-premium-secret-key-2025')
 
 DATABASE = 'finsight.db'
 
+# Bump when the schema in init_db changes, existing databases are then upgraded once
+SCHEMA_VERSION = 2
+
+# Set once this process has checked the schema
+db_initialized = False
+
 
 def get_db():
-    """Get database connection"""
+    """Get database connection (sets up the schema on first use)"""
+    global db_initialized
     conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
+    if not db_initialized:
+        init_db(conn)
+        db_initialized = True
     return conn
 
 
-def init_db():
-    """Initialize database tables"""
-    conn = get_db()
+def init_db(conn):
+    """
+    Initialize database tables
+
+    The schema version is stored in the database file, so only the first
+    worker to touch a new or outdated database runs the setup.
+    """
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return
+
     conn.execute('''
         CREATE TABLE IF NOT EXISTS analysis_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,14 +78,48 @@ def init_db():
             report TEXT
         )
     ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            analysis_id INTEGER,
+            context TEXT,
+            history_summary TEXT,
+            summarized_until INTEGER DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_session
+        ON chat_messages (session_id, id)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS statement_pages (
+            username TEXT NOT NULL,
+            page_hash TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (username, page_hash)
+        )
+    ''')
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
-    conn.close()
 
 
 def save_analysis(username, filename, data):
-    """Save analysis result to database"""
+    """Save analysis result to database, returns the new record ID"""
     conn = get_db()
-    conn.execute('''
+    cursor = conn.execute('''
         INSERT INTO analysis_history (username, filename, summary, categories, transactions, report)
         VALUES (?, ?, ?, ?, ?, ?)
     ''', (
@@ -75,6 +132,7 @@ def save_analysis(username, filename, data):
     ))
     conn.commit()
     conn.close()
+    return cursor.lastrowid
 
 
 def get_user_history(username, limit=20):
@@ -125,16 +183,166 @@ def get_analysis_detail(analysis_id, username):
     }
 
 
+def get_analysis_transactions(analysis_id, username):
+    """Get only the transactions of an analysis, or None if not found"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT transactions FROM analysis_history
+        WHERE id = ? AND username = ?
+    ''', (analysis_id, username)).fetchone()
+    conn.close()
+
+    if not row:
+        return None
+
+    return json.loads(row['transactions']) if row['transactions'] else []
+
+
 def delete_analysis(analysis_id, username):
     """Delete analysis record"""
     conn = get_db()
     conn.execute('DELETE FROM analysis_history WHERE id = ? AND username = ?', (analysis_id, username))
+    conn.execute('''
+        DELETE FROM chat_messages WHERE session_id IN (
+            SELECT id FROM chat_sessions WHERE analysis_id = ? AND username = ?
+        )
+    ''', (analysis_id, username))
+    conn.execute('DELETE FROM chat_sessions WHERE analysis_id = ? AND username = ?', (analysis_id, username))
+
+    # Stored page results are shared between a user's analyses, so they go
+    # with the last one
+    remaining = conn.execute('SELECT COUNT(*) FROM analysis_history WHERE username = ?', (username,)).fetchone()[0]
+    if not remaining:
+        conn.execute('DELETE FROM statement_pages WHERE username = ?', (username,))
+
     conn.commit()
     conn.close()
 
 
-# Initialize database on startup
-init_db()
+def get_user_transactions_signature(username):
+    """Get (record count, latest record ID) of a user's analyses, changes whenever they do"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT COUNT(*), MAX(id) FROM analysis_history
+        WHERE username = ?
+    ''', (username,)).fetchone()
+    conn.close()
+    return (row[0], row[1])
+
+
+def get_user_transactions(username):
+    """Get all stored transactions of a user as (analysis ID, transaction), oldest analysis first"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT id, transactions FROM analysis_history
+        WHERE username = ?
+        ORDER BY id
+    ''', (username,)).fetchall()
+    conn.close()
+
+    transactions = []
+    for row in rows:
+        if row['transactions']:
+            transactions.extend((row['id'], t) for t in json.loads(row['transactions']))
+    return transactions
+
+
+def get_page_results(username, page_hashes):
+    """Get stored parse results of statement pages, keyed by page hash"""
+    if not page_hashes:
+        return {}
+
+    conn = get_db()
+    placeholders = ','.join('?' * len(page_hashes))
+    rows = conn.execute(f'''
+        SELECT page_hash, result FROM statement_pages
+        WHERE username = ? AND page_hash IN ({placeholders})
+    ''', (username, *page_hashes)).fetchall()
+    conn.close()
+    return {row['page_hash']: json.loads(row['result']) for row in rows}
+
+
+def save_page_result(username, page_hash, result):
+    """Store the parse result of a statement page"""
+    conn = get_db()
+    conn.execute('''
+        INSERT OR REPLACE INTO statement_pages (username, page_hash, result)
+        VALUES (?, ?, ?)
+    ''', (username, page_hash, json.dumps(result)))
+    conn.commit()
+    conn.close()
+
+
+def create_chat_session(username, analysis_id, context):
+    """
+    Create a chat session with its cached financial context, returns the session ID
+
+    username is the owner key: the login name, or an anonymous token key.
+    """
+    conn = get_db()
+    cursor = conn.execute('''
+        INSERT INTO chat_sessions (username, analysis_id, context)
+        VALUES (?, ?, ?)
+    ''', (username, analysis_id, context))
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+def get_chat_session(session_id, username):
+    """Get chat session by ID"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT * FROM chat_sessions
+        WHERE id = ? AND username = ?
+    ''', (session_id, username)).fetchone()
+    conn.close()
+
+    if not row:
+        return None
+
+    return {
+        'id': row['id'],
+        'analysis_id': row['analysis_id'],
+        'context': row['context'] or '',
+        'history_summary': row['history_summary'] or '',
+        'summarized_until': row['summarized_until'] or 0
+    }
+
+
+def get_chat_messages(session_id, after_id=0):
+    """Get chat messages of a session newer than after_id, oldest first"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT id, role, content, tokens FROM chat_messages
+        WHERE session_id = ? AND id > ?
+        ORDER BY id
+    ''', (session_id, after_id)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def add_chat_messages(session_id, messages):
+    """Append (role, content) messages to a chat session"""
+    conn = get_db()
+    conn.executemany('''
+        INSERT INTO chat_messages (session_id, role, content, tokens)
+        VALUES (?, ?, ?, ?)
+    ''', [(session_id, role, content, estimate_tokens(content)) for role, content in messages])
+    conn.commit()
+    conn.close()
+
+
+def update_chat_summary(session_id, history_summary, summarized_until):
+    """Store the rolling summary of turns that left the history window"""
+    conn = get_db()
+    conn.execute('''
+        UPDATE chat_sessions
+        SET history_summary = ?, summarized_until = ?
+        WHERE id = ?
+    ''', (history_summary, summarized_until, session_id))
+    conn.commit()
+    conn.close()
 
 # ==========================================
 # Fixed Categories Definition
@@ -164,6 +372,9 @@ def get_openai_client():
     if openai_client is None:
         api_key = os.getenv('OPENAI_API_KEY')
         if api_key:
+            from openai import OpenAI
+            import httpx
+
             # Use custom http_client to avoid proxy issues
             openai_client = OpenAI(
                 api_key=api_key,
@@ -195,25 +406,31 @@ Requirements:
 4. Amount: expenses as negative numbers, income as positive numbers
 5. Automatically identify opening and closing balances
 6. If certain fields cannot be identified, make reasonable inferences or use default values
+7. Each page starts with a "=== Page N ===" marker. Return one entry per page, with that page's transactions and the opening and closing balances shown on that page (null if the page shows none)
 
-Statement content:
+Statement content (table rows are |-delimited cells under the column header row):
 {content}
 
 Return format example:
 {{
-  "summary": {{
-    "start_balance": 2367.20,
-    "end_balance": 2239.05,
-    "total_income": 0.00,
-    "total_expense": 128.15
-  }},
-  "transactions": [
+  "pages": [
     {{
-      "date": "2025-12-03",
-      "description": "PRIME SUPERMARKET",
-      "amount": -8.60,
-      "balance": 2352.10,
-      "category": "Food & Dining"
+      "page": 1,
+      "summary": {{
+        "start_balance": 2367.20,
+        "end_balance": 2239.05,
+        "total_income": 0.00,
+        "total_expense": 128.15
+      }},
+      "transactions": [
+        {{
+          "date": "2025-12-03",
+          "description": "PRIME SUPERMARKET",
+          "amount": -8.60,
+          "balance": 2352.10,
+          "category": "Food & Dining"
+        }}
+      ]
     }}
   ]
 }}
@@ -272,67 +489,253 @@ If financial data context is provided, you can:
 - Compare their spending to typical patterns
 """
 
+CHAT_SUMMARY_PROMPT_TEMPLATE = """Update the running summary of a conversation between a user and a financial assistant.
+
+Requirements:
+1. Merge the earlier summary with the new messages below
+2. Keep facts, figures, and user preferences or goals that may matter later
+3. Drop greetings and small talk
+4. Keep the summary under 150 words
+
+Earlier summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
 # ==========================================
 # PDF Processing Functions
 # ==========================================
 
-def check_pdf_encrypted(file):
+def is_pdf_password_error(error):
+    """Check if a PDF error means a (correct) password is required"""
+    # pdfminer raises PDFPasswordIncorrect with an empty message, so check the type name too
+    error_msg = f"{type(error).__name__} {error}".lower()
+    return 'encrypt' in error_msg or 'password' in error_msg
+
+
+def check_pdf_encrypted(file, password=None):
     """
-    Check if PDF is encrypted
+    Check if PDF is encrypted and cannot be opened with the given password
 
     Args:
         file: File object from Flask request.files
+        password: Optional PDF password
 
     Returns:
-        bool: True if encrypted, False otherwise
+        bool: True if a (correct) password is still needed, False otherwise
     """
+    import pdfplumber
+
     try:
-        with pdfplumber.open(file) as pdf:
+        with pdfplumber.open(file, password=password) as pdf:
             # Try to read the first page
             if len(pdf.pages) > 0:
                 _ = pdf.pages[0].extract_text()
             return False
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'encrypt' in error_msg or 'password' in error_msg:
+        if is_pdf_password_error(e):
             return True
         raise e
 
 
-def extract_text_from_pdf(file):
+# Money amounts such as 1,234.56  -8.60  (12.00)  $5.00  45.10CR
+AMOUNT_PATTERN = re.compile(r"^[-+(]?[$€£]?\d[\d,]*\.\d{2}\)?(?:CR|DR|-)?$", re.IGNORECASE)
+YEAR_PATTERN_TEXT = re.compile(r"\b(?:19|20)\d{2}\b")
+STATEMENT_CONTEXT_PATTERN = re.compile(r"\b(?:period|statement|as at|as of)\b", re.IGNORECASE)
+
+# Words that mark the column header row of a transaction table
+TABLE_HEADER_WORDS = {
+    'date', 'description', 'details', 'transaction', 'transactions', 'particulars', 'reference',
+    'withdrawal', 'withdrawals', 'deposit', 'deposits', 'debit', 'debits', 'credit', 'credits',
+    'amount', 'balance', 'value', 'narrative'
+}
+
+# Minimum horizontal gap (pt) between words of different cells
+CELL_GAP = 6
+# Maximum vertical offset (pt) between words of the same line
+LINE_TOLERANCE = 3
+
+
+def group_words_into_lines(words):
+    """Group pdfplumber words into lines by vertical position, left to right"""
+    lines = []
+    for word in sorted(words, key=lambda w: (w['top'], w['x0'])):
+        if lines and abs(word['top'] - lines[-1][0]['top']) <= LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w['x0']) for line in lines]
+
+
+def line_text(line):
+    """Join the words of a line with single spaces"""
+    return ' '.join(word['text'] for word in line)
+
+
+def has_amount(line):
+    """Check if a line contains a money amount"""
+    return any(AMOUNT_PATTERN.match(word['text']) for word in line)
+
+
+def split_into_cells(line):
+    """Split a line into cells of (x0, x1, text) wherever words are far apart"""
+    cells = []
+    for word in line:
+        if cells and word['x0'] - cells[-1][1] <= CELL_GAP:
+            x0, _, text = cells[-1]
+            cells[-1] = (x0, word['x1'], f"{text} {word['text']}")
+        else:
+            cells.append((word['x0'], word['x1'], word['text']))
+    return cells
+
+
+def find_table_columns(line):
+    """
+    Get the column layout if the line is a transaction table header
+
+    Returns:
+        list: Column (x0, x1, label) cells, or None if not a header row
+    """
+    if has_amount(line):
+        return None
+    words = {word['text'].lower().strip(':') for word in line}
+    if len(words & TABLE_HEADER_WORDS) < 3:
+        return None
+    return split_into_cells(line)
+
+
+def serialize_row(line, columns):
+    """
+    Serialize a table line as a |-delimited row
+
+    Words are placed into the header columns by horizontal position, so
+    an empty withdrawal or deposit cell is kept as an empty field.
+    """
+    if not columns:
+        return '|'.join(cell[2] for cell in split_into_cells(line))
+
+    # Column boundaries sit halfway between neighbouring header labels
+    bounds = [(columns[i][1] + columns[i + 1][0]) / 2 for i in range(len(columns) - 1)]
+    cells = [[] for _ in columns]
+    for word in line:
+        center = (word['x0'] + word['x1']) / 2
+        index = next((i for i, bound in enumerate(bounds) if center < bound), len(columns) - 1)
+        cells[index].append(word['text'])
+    return '|'.join(' '.join(cell) for cell in cells).rstrip('|')
+
+
+def serialize_statement_layout(pdf_pages):
+    """
+    Serialize statement pages into compact transaction table rows
+
+    Uses word coordinates to keep only the transaction table region of each
+    page (from the first column header or amount line to the last line with
+    an amount), drops the lines outside it such as headers, footers and
+    legal text, and emits each row as |-delimited cells. The statement
+    period or date line is kept once as shared context, since table rows
+    often omit the year.
+
+    Args:
+        pdf_pages: pdfplumber pages
+
+    Returns:
+        dict: 'pages' (serialized text per page, empty if no table found)
+              and 'context' (shared statement context text)
+    """
+    pages = []
+    context = []
+    columns = None
+    for page in pdf_pages:
+        lines = group_words_into_lines(page.extract_words())
+        amount_rows = [i for i, line in enumerate(lines) if has_amount(line)]
+        first = amount_rows[0] if amount_rows else len(lines)
+        last = amount_rows[-1] if amount_rows else -1
+
+        # Every header row above the last amount resets the columns, so the
+        # header nearest above each run of amount rows wins, e.g. a table
+        # header below a summary box (columns are kept from earlier pages
+        # when a table continues without repeating its header)
+        header_columns = {}
+        for i in range(last):
+            page_columns = find_table_columns(lines[i])
+            if page_columns:
+                header_columns[i] = page_columns
+        if header_columns:
+            first = min(first, min(header_columns))
+
+        rows = []
+        for i, line in enumerate(lines):
+            text = line_text(line)
+            if i in header_columns:
+                columns = header_columns[i]
+                rows.append('|'.join(column[2] for column in columns))
+            elif first <= i <= last:
+                rows.append(serialize_row(line, columns))
+            elif YEAR_PATTERN_TEXT.search(text) and STATEMENT_CONTEXT_PATTERN.search(text) \
+                    and text not in context:
+                context.append(text)
+
+        pages.append('\n'.join(rows) if amount_rows else '')
+
+    return {'pages': pages, 'context': '\n'.join(context[:3])}
+
+
+def extract_pages_from_pdf(file, password=None):
     """
-    Extract text content from PDF file
+    Extract compact transaction text from each page of a PDF file
+
+    Encrypted PDFs are decrypted in memory with the given password.
+    Pages are serialized with serialize_statement_layout; if no transaction
+    table can be found, the raw page text is used instead.
 
     Args:
         file: File object from Flask request.files
+        password: Optional PDF password
 
     Returns:
-        str: Extracted text content
+        dict: 'pages' (text of each page with content, in page order),
+              'context' (shared statement context) and 'raw_pages'
+              (raw text of each page, for reporting)
     """
-    text = ""
+    import pdfplumber
 
     try:
         # Reset file pointer
         file.seek(0)
 
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        with pdfplumber.open(file, password=password) as pdf:
+            raw_pages = [page.extract_text() or '' for page in pdf.pages]
+            layout = serialize_statement_layout(pdf.pages)
 
-        if not text.strip():
+        raw_pages = [page for page in raw_pages if page.strip()]
+        if not raw_pages:
             raise Exception("PDF file is empty or text cannot be extracted")
 
-        return text
+        compact_pages = [page for page in layout['pages'] if page]
+        if not compact_pages:
+            return {'pages': raw_pages, 'context': '', 'raw_pages': raw_pages}
+
+        return {'pages': compact_pages, 'context': layout['context'], 'raw_pages': raw_pages}
 
     except Exception as e:
-        error_msg = str(e).lower()
-        if 'encrypt' in error_msg or 'password' in error_msg:
-            raise Exception("PDF is encrypted. Please upload a screenshot instead.")
+        if is_pdf_password_error(e):
+            raise Exception("PDF is encrypted. Please enter its password or upload a screenshot instead.")
         raise Exception(f"PDF extraction failed: {str(e)}")
 
 
+def hash_page_text(text):
+    """
+    Hash page text so the same page is recognized in a later upload
+
+    Whitespace is normalized, so layout jitter between re-issued
+    statements does not change the hash.
+    """
+    normalized = ' '.join(text.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
 # ==========================================
 # Image Processing Functions
 # ==========================================
@@ -480,6 +883,12 @@ Return format:
 # OpenAI API Functions
 # ==========================================
 
+# Statement text sent per parse call; pages are batched up to this size
+PARSE_MAX_CHARS = 20000
+# Parse calls run at once when a statement needs more than one batch
+PARSE_MAX_CONCURRENT_CALLS = 4
+
+
 def parse_text_with_openai(text):
     """
     Use OpenAI API to parse text into structured JSON data
@@ -495,9 +904,8 @@ def parse_text_with_openai(text):
         raise Exception("OPENAI_API_KEY not configured. Please set it in .env file")
 
     # Limit input length (increased for full monthly statements)
-    max_chars = 20000
-    if len(text) > max_chars:
-        text = text[:max_chars] + "\n...(content truncated)"
+    if len(text) > PARSE_MAX_CHARS:
+        text = text[:PARSE_MAX_CHARS] + "\n...(content truncated)"
 
     try:
         response = get_openai_client().chat.completions.create(
@@ -524,6 +932,152 @@ def parse_text_with_openai(text):
         raise Exception(f"OpenAI parsing failed: {str(e)}")
 
 
+def batch_unseen_pages(pages, page_hashes, known, context=''):
+    """
+    Group pages without a stored result into parse batches
+
+    Each distinct page is sent once, marked with its page number, and batches
+    are filled up to PARSE_MAX_CHARS so a typical statement needs one call.
+
+    Args:
+        pages: Text of each page, in page order
+        page_hashes: Hash of each page's text
+        known: Stored results by page hash
+        context: Shared statement context sent at the top of each batch
+
+    Returns:
+        list: Batches of (page number, page hash, marked page text)
+    """
+    batches = []
+    batch_chars = 0
+    queued = set()
+
+    for number, (page_text, page_hash) in enumerate(zip(pages, page_hashes), 1):
+        if page_hash in known or page_hash in queued:
+            continue
+        queued.add(page_hash)
+
+        marked = f"=== Page {number} ===\n{page_text}"
+        if batches and batch_chars + len(marked) + 1 <= PARSE_MAX_CHARS - len(context):
+            batches[-1].append((number, page_hash, marked))
+            batch_chars += len(marked) + 1
+        else:
+            batches.append([(number, page_hash, marked)])
+            batch_chars = len(marked)
+
+    return batches
+
+
+def format_page_batch(batch, context=''):
+    """Join the shared context and the marked pages of a batch into parse content"""
+    return '\n'.join(([context] if context else []) + [marked for _, _, marked in batch])
+
+
+def estimate_parse_tokens(pages, context=''):
+    """
+    Estimate the prompt tokens of parsing pages that have not been seen before
+
+    Counts the full parse prompt (template plus content) of every call
+    parse_pdf_pages would make, so layouts that need more calls pay for
+    the template each time.
+
+    Args:
+        pages: Text of each page, in page order
+        context: Shared statement context sent with each batch
+
+    Returns:
+        tuple: (estimated prompt tokens, number of parse calls)
+    """
+    batches = batch_unseen_pages(pages, [hash_page_text(page) for page in pages], {}, context)
+    tokens = sum(
+        estimate_tokens(PARSE_PROMPT_TEMPLATE.format(content=format_page_batch(batch, context)))
+        for batch in batches
+    )
+    return tokens, len(batches)
+
+
+def parse_page_batch(batch, context=''):
+    """
+    Parse one batch of marked pages and split the result back per page
+
+    Args:
+        batch: List of (page number, page hash, marked page text)
+        context: Shared statement context (e.g. the statement period)
+
+    Returns:
+        dict: Parsed data by page hash, for pages the model returned
+    """
+    result = parse_text_with_openai(format_page_batch(batch, context))
+
+    pages = result.get('pages')
+    if not isinstance(pages, list):
+        # A one-page batch may come back as a single statement object
+        pages = [dict(result, page=batch[0][0])] if len(batch) == 1 and 'transactions' in result else []
+
+    by_number = {}
+    for page in pages:
+        if not isinstance(page, dict):
+            continue
+        try:
+            by_number[int(page.get('page'))] = page
+        except (TypeError, ValueError):
+            continue
+
+    parsed = {
+        page_hash: {
+            'summary': by_number[number].get('summary', {}) or {},
+            'transactions': by_number[number].get('transactions', []) or []
+        }
+        for number, page_hash, _ in batch if number in by_number
+    }
+    if not parsed:
+        raise Exception("OpenAI parsing failed: no page results in the model response")
+
+    return parsed
+
+
+def parse_pdf_pages(pages, username=None, context=''):
+    """
+    Parse statement pages, sending only pages not seen before to OpenAI
+
+    Unseen pages go out together in as few calls as fit PARSE_MAX_CHARS,
+    and each page's result is stored under the hash of its text, so an
+    overlapping or re-issued statement only pays for the pages that changed.
+
+    Args:
+        pages: Text of each page, in page order
+        username: Logged-in username, page results are only stored for logged-in users
+        context: Shared statement context (e.g. the statement period) sent with each batch
+
+    Returns:
+        dict: Parsed structured data for the whole statement
+    """
+    page_hashes = [hash_page_text(page) for page in pages]
+    known = get_page_results(username, page_hashes) if username else {}
+
+    batches = batch_unseen_pages(pages, page_hashes, known, context)
+    if len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(batches), PARSE_MAX_CONCURRENT_CALLS)) as executor:
+            parsed = list(executor.map(lambda batch: parse_page_batch(batch, context), batches))
+    else:
+        parsed = [parse_page_batch(batch, context) for batch in batches]
+
+    new_pages = 0
+    for batch_results in parsed:
+        for page_hash, result in batch_results.items():
+            known[page_hash] = result
+            new_pages += 1
+            if username:
+                save_page_result(username, page_hash, result)
+
+    # A page the model skipped contributes nothing and is retried on the next upload
+    results = [known.get(page_hash, {'transactions': []}) for page_hash in page_hashes]
+
+    print(f"[Pages] {len(pages)} pages, {new_pages} parsed in {len(batches)} calls, "
+          f"{len(pages) - sum(len(b) for b in batches)} reused")
+    return merge_page_results(results)
+
+
 def generate_ai_report(data):
     """
     Use OpenAI API to generate financial analysis report
@@ -584,6 +1138,96 @@ def calculate_categories(transactions):
     return categories
 
 
+def merge_page_results(results):
+    """
+    Combine per-page parse results into one statement
+
+    The opening balance comes from the first page that reports one and the
+    closing balance from the last; income and expense totals are recomputed
+    from the combined transactions.
+
+    Args:
+        results: Parsed data of each page, in page order
+
+    Returns:
+        dict: Parsed structured data for the whole statement
+    """
+    transactions = []
+    for result in results:
+        transactions.extend(result.get('transactions', []))
+
+    start_balances = [r.get('summary', {}).get('start_balance') for r in results]
+    end_balances = [r.get('summary', {}).get('end_balance') for r in results]
+    start_balances = [b for b in start_balances if b is not None]
+    end_balances = [b for b in end_balances if b is not None]
+
+    # Fall back to the balances around the first and last transaction
+    if not start_balances and transactions:
+        first = transactions[0]
+        start_balances = [round(first.get('balance', 0) - first.get('amount', 0), 2)]
+    if not end_balances and transactions:
+        end_balances = [transactions[-1].get('balance', 0)]
+
+    return {
+        'summary': {
+            'start_balance': start_balances[0] if start_balances else 0,
+            'end_balance': end_balances[-1] if end_balances else 0,
+            'total_income': round(sum(t['amount'] for t in transactions if t.get('amount', 0) > 0), 2),
+            'total_expense': round(sum(-t['amount'] for t in transactions if t.get('amount', 0) < 0), 2)
+        },
+        'transactions': transactions
+    }
+
+
+def downsample_lttb(values, threshold):
+    """
+    Downsample a series with Largest-Triangle-Three-Buckets
+
+    Keeps the first and last point, and from each bucket in between the
+    point forming the largest triangle with its neighbours, so peaks and
+    dips survive while the point count drops to threshold.
+
+    Args:
+        values: Y values, evenly spaced on the X axis
+        threshold: Number of points to keep
+
+    Returns:
+        list: Indexes of the kept points, in order
+    """
+    count = len(values)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    selected = [0]
+    bucket_size = (count - 2) / (threshold - 2)
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket (or the last point) is the third triangle corner
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        best_index, best_area = start, -1
+        for i in range(start, end):
+            area = abs((previous - avg_x) * (values[i] - values[previous]) -
+                       (previous - i) * (avg_y - values[previous]))
+            if area > best_area:
+                best_index, best_area = i, area
+
+        selected.append(best_index)
+        previous = best_index
+
+    selected.append(count - 1)
+    return selected
+
+
 def validate_data(data):
     """Validate data format"""
     required_keys = ['summary', 'transactions']
@@ -597,6 +1241,736 @@ def validate_data(data):
     return True
 
 
+# ==========================================
+# Local Query Engine
+# ==========================================
+
+# Words that map a question onto one of the fixed categories
+CATEGORY_KEYWORDS = {
+    "Food & Dining": ["food", "dining", "restaurant", "restaurants", "groceries", "grocery", "eating out", "takeaway"],
+    "Transportation": ["transport", "transportation", "transit", "taxi", "taxis", "uber", "fuel", "petrol", "parking"],
+    "Shopping": ["shopping", "clothes", "clothing", "electronics"],
+    "Entertainment": ["entertainment", "movies", "games", "streaming", "hobbies"],
+    "Utilities": ["utilities", "bills", "electricity", "internet", "phone bill"],
+    "Healthcare": ["healthcare", "health", "medical", "pharmacy", "dental"],
+    "Education": ["education", "tuition", "courses", "books"],
+    "Travel": ["travel", "hotels", "hotel", "flights", "vacation", "holiday"],
+    "Transfer": ["transfers", "transfer"],
+    "Income": ["income", "salary"]
+}
+
+MONTH_NAMES = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8,
+    "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12
+}
+
+# Open-ended questions that should always go to the LLM
+ADVICE_PATTERN = re.compile(
+    r"\b(should|could|would|advice|advise|tips?|recommend\w*|suggest\w*|reduce|save|saving|budget\w*|why|better|improve)\b"
+)
+
+MONTH_PATTERN = re.compile(
+    r"\b(?:in|during|for|of)\s+(" + "|".join(sorted(MONTH_NAMES, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?"
+)
+RELATIVE_MONTH_PATTERN = re.compile(r"\b(last|this|previous|current)\s+month\b")
+YEAR_PATTERN = re.compile(r"\b(?:in|during|for)\s+(\d{4})\b")
+MERCHANT_PATTERN = re.compile(r"\b(?:at|on|from|to|with)\s+(.+)$")
+SPEND_PATTERN = re.compile(r"\b(spen[dt]|spending|pa(?:y|id)|payments?|cost|expenses?|purchases?|bought)\b")
+# Time words left over after parse_date_filter mean a date range it can't
+# handle ("last year", "since March"), so the question goes to the LLM
+# rather than being answered over all dates
+UNPARSED_DATE_PATTERN = re.compile(
+    r"\b(years?|yearly|annual\w*|weeks?|weekly|weekends?|days?|daily|months?|monthly|quarters?|q[1-4]|"
+    r"yesterday|today|tonight|recent\w*|ago|since|before|after|between|until|till|\d{4}|"
+    + "|".join(name for name in MONTH_NAMES if len(name) > 3) + r")\b"
+)
+# Balance questions ("how much do I have left") are not spend sums
+BALANCE_PATTERN = re.compile(r"\b(balance|left|remaining|do i have|net worth)\b")
+
+# Per-user transaction indexes, rebuilt when the user's analyses change
+_transaction_indexes = {}
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric words"""
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def get_transaction_index(username):
+    """
+    Get the transaction index of a user, building it on first use
+
+    The index holds deduplicated transactions (overlapping statements repeat rows)
+    with parsed dates, a keyword -> positions map over descriptions, a
+    category -> positions map and an analysis ID -> positions map.
+
+    Args:
+        username: Logged-in username
+
+    Returns:
+        dict: Transaction index
+    """
+    signature = get_user_transactions_signature(username)
+    index = _transaction_indexes.get(username)
+    if index and index['signature'] == signature:
+        return index
+
+    transactions = []
+    keywords = {}
+    categories = {}
+    analyses = {}
+    seen = {}
+
+    for analysis_id, transaction in get_user_transactions(username):
+        key = (transaction.get('date'), transaction.get('description'),
+               transaction.get('amount'), transaction.get('balance'))
+        if key in seen:
+            analyses.setdefault(analysis_id, set()).add(seen[key])
+            continue
+        seen[key] = len(transactions)
+
+        try:
+            date = datetime.strptime(str(transaction.get('date', '')), '%Y-%m-%d')
+        except ValueError:
+            date = None
+
+        position = len(transactions)
+        transactions.append({
+            'date': date,
+            'description': transaction.get('description', ''),
+            'amount': float(transaction.get('amount') or 0),
+            'category': transaction.get('category', 'Other')
+        })
+        for word in set(tokenize(transaction.get('description', ''))):
+            keywords.setdefault(word, set()).add(position)
+        categories.setdefault(transaction.get('category', 'Other'), set()).add(position)
+        analyses.setdefault(analysis_id, set()).add(position)
+
+    index = {
+        'signature': signature,
+        'transactions': transactions,
+        'keywords': keywords,
+        'categories': categories,
+        'analyses': analyses
+    }
+    _transaction_indexes[username] = index
+    return index
+
+
+def lookup_merchant(index, term, substring=True):
+    """
+    Find transactions whose description matches every word of term
+
+    Args:
+        index: Transaction index
+        term: Merchant name from the question
+        substring: Also scan descriptions for the term when no word matches
+
+    Returns:
+        set: Matching transaction positions, empty if none
+    """
+    words = tokenize(term)
+    if not words:
+        return set()
+
+    positions = None
+    for word in words:
+        matches = index['keywords'].get(word, set())
+        positions = matches if positions is None else positions & matches
+    if positions or not substring:
+        return positions or set()
+
+    # Fall back to a substring scan for merchants split differently in descriptions
+    needle = "".join(words)
+    return {
+        i for i, transaction in enumerate(index['transactions'])
+        if needle in "".join(tokenize(transaction['description']))
+    }
+
+
+def match_category(text):
+    """Get the fixed category mentioned in text, or None"""
+    for category, words in CATEGORY_KEYWORDS.items():
+        for word in words:
+            if re.search(r"\b" + re.escape(word) + r"\b", text):
+                return category
+    return None
+
+
+def parse_date_filter(text, index):
+    """
+    Parse a month or year filter from the question
+
+    Returns:
+        tuple: (year, month or None, label, text without the date phrase),
+               year is None when no filter was found
+    """
+    today = datetime.now()
+
+    match = RELATIVE_MONTH_PATTERN.search(text)
+    if match:
+        year, month = today.year, today.month
+        if match.group(1) in ('last', 'previous'):
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        label = datetime(year, month, 1).strftime('%B %Y')
+        return year, month, label, text[:match.start()] + text[match.end():]
+
+    match = MONTH_PATTERN.search(text)
+    if match:
+        month = MONTH_NAMES[match.group(1)]
+        if match.group(2):
+            year = int(match.group(2))
+        else:
+            # Without a year, use the most recent one that has data for the month
+            years = [t['date'].year for t in index['transactions'] if t['date'] and t['date'].month == month]
+            year = max(years) if years else today.year
+        label = datetime(year, month, 1).strftime('%B %Y')
+        return year, month, label, text[:match.start()] + text[match.end():]
+
+    match = YEAR_PATTERN.search(text)
+    if match:
+        year = int(match.group(1))
+        return year, None, str(year), text[:match.start()] + text[match.end():]
+
+    return None, None, None, text
+
+
+def answer_transaction_question(username, message, analysis_id=None):
+    """
+    Answer lookup and sum questions from the user's stored transactions
+
+    Handles questions like "how much did I spend at Starbucks",
+    "largest expense in March" or "total transport last month".
+
+    Args:
+        username: Logged-in username
+        message: User's chat message
+        analysis_id: Statement the chat is about; None covers all saved statements
+
+    Returns:
+        str: Markdown answer, or None if the question should go to the LLM
+    """
+    text = message.lower().strip().rstrip('?!.')
+
+    if ADVICE_PATTERN.search(text) or BALANCE_PATTERN.search(text):
+        return None
+
+    category = match_category(text)
+
+    if re.search(r"\b(largest|biggest|highest|most expensive)\b", text) and \
+            re.search(r"\b(expense|purchase|payment|transaction|spend\w*)\b", text):
+        intent = 'largest'
+    elif re.search(r"\bhow many\b", text):
+        intent = 'count'
+    elif re.search(r"\b(income|earn\w*|receiv\w*|deposits?)\b", text) and \
+            re.search(r"\b(how much|total)\b", text):
+        intent = 'income'
+    elif re.search(r"\bhow much\b.*\b(spen[dt]|pa(?:y|id)|cost)\b", text) or \
+            (re.search(r"\btotal\b", text) and (SPEND_PATTERN.search(text) or (category and category != 'Income'))):
+        intent = 'spent'
+    else:
+        return None
+
+    index = get_transaction_index(username)
+    if analysis_id is not None and analysis_id not in index['analyses']:
+        return None
+    if not index['transactions']:
+        return None
+
+    year, month, period, text = parse_date_filter(text, index)
+    if UNPARSED_DATE_PATTERN.search(text):
+        return None
+
+    if analysis_id is not None:
+        positions = set(index['analyses'][analysis_id])
+        scope_text = ""
+    else:
+        positions = set(range(len(index['transactions'])))
+        scope_text = " This covers all your saved statements."
+    subject = ""
+
+    # A merchant named in the question wins over a category keyword
+    # ("at Uber" is Uber, not all Transportation)
+    merchant_match = MERCHANT_PATTERN.search(text)
+    term = ""
+    matches = set()
+    if merchant_match:
+        term = re.sub(r"\b(transactions?|purchases?|payments?|expenses?|in total|total|altogether)\b", "",
+                      merchant_match.group(1)).strip()
+        if term:
+            # Category words only count as a merchant on an exact description word
+            matches = lookup_merchant(index, term, substring=not category) & positions
+
+    if matches:
+        positions = matches
+        subject = f" at {term.title()}"
+    elif category and category != 'Income':
+        positions &= index['categories'].get(category, set())
+        subject = f" on {category}"
+    elif term:
+        return None
+
+    if year is not None:
+        positions = {
+            i for i in positions
+            if index['transactions'][i]['date']
+            and index['transactions'][i]['date'].year == year
+            and (month is None or index['transactions'][i]['date'].month == month)
+        }
+
+    selected = [index['transactions'][i] for i in sorted(positions)]
+    expenses = [t for t in selected if t['amount'] < 0]
+    period_text = f" in {period}" if period else ""
+
+    if intent == 'income':
+        income = [t for t in selected if t['amount'] > 0]
+        total = sum(t['amount'] for t in income)
+        return f"You received **${total:,.2f}**{subject.replace(' at ', ' from ')}{period_text} " \
+               f"across {len(income)} transaction{'s' if len(income) != 1 else ''}.{scope_text}"
+
+    if intent == 'count':
+        # "How many transactions" counts everything, "how many payments/times" counts spending
+        if re.search(r"\btransactions?\b", text) and not SPEND_PATTERN.search(text):
+            return f"You had **{len(selected)}** transaction{'s' if len(selected) != 1 else ''}" \
+                   f"{subject}{period_text}.{scope_text}"
+        return f"You made **{len(expenses)}** payment{'s' if len(expenses) != 1 else ''}" \
+               f"{subject}{period_text}.{scope_text}"
+
+    if not expenses:
+        return f"I couldn't find any expenses{subject}{period_text} in your statements.{scope_text}"
+
+    if intent == 'largest':
+        top = min(expenses, key=lambda t: t['amount'])
+        date = top['date'].strftime('%Y-%m-%d') if top['date'] else 'unknown date'
+        return f"Your largest expense{subject}{period_text} was **${abs(top['amount']):,.2f}** " \
+               f"— {top['description']} on {date} ({top['category']}).{scope_text}"
+
+    total = sum(abs(t['amount']) for t in expenses)
+    return f"You spent **${total:,.2f}**{subject}{period_text} " \
+           f"across {len(expenses)} transaction{'s' if len(expenses) != 1 else ''}.{scope_text}"
+
+
+# ==========================================
+# Chat Context Functions
+# ==========================================
+
+# Token budget for recent chat turns sent verbatim; older turns are summarized
+CHAT_HISTORY_TOKEN_BUDGET = 1200
+# Once over budget, older turns are folded until the recent turns fit this,
+# so the summary call runs every few turns instead of on every turn
+CHAT_HISTORY_FOLD_TARGET = CHAT_HISTORY_TOKEN_BUDGET // 2
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token)"""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+def build_chat_context(data):
+    """
+    Build the compact financial context for the chat system prompt
+
+    Args:
+        data: Statement data with summary, categories and transactions
+
+    Returns:
+        str: Context text, empty if no data
+    """
+    if not data:
+        return ""
+
+    summary = data.get('summary', {})
+    categories = data.get('categories', {})
+    transaction_count = data.get('transaction_count', len(data.get('transactions', [])))
+    top_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)[:3]
+
+    return f"""
+
+User's Financial Data Context:
+- Opening Balance: ${summary.get('start_balance', 'N/A')}
+- Closing Balance: ${summary.get('end_balance', 'N/A')}
+- Total Income: ${summary.get('total_income', 'N/A')}
+- Total Expenses: ${summary.get('total_expense', 'N/A')}
+- Number of Transactions: {transaction_count}
+- Top Spending Categories: {', '.join([f"{k}: ${v:.2f}" for k, v in top_categories])}
+"""
+
+
+def summarize_chat_history(summary, messages):
+    """
+    Fold chat messages that left the history window into the running summary
+
+    Args:
+        summary: Earlier summary text (may be empty)
+        messages: Messages to fold in, oldest first
+
+    Returns:
+        str: Updated summary
+    """
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+
+    response = get_openai_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "user",
+                "content": CHAT_SUMMARY_PROMPT_TEMPLATE.format(
+                    summary=summary or "(none)",
+                    messages=transcript
+                )
+            }
+        ],
+        temperature=0,
+        max_tokens=300
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+def chat_history_window(messages, budget):
+    """Index of the oldest message that fits the token budget, walking back from the newest"""
+    used_tokens = 0
+    keep_from = len(messages)
+    while keep_from > 0 and used_tokens + messages[keep_from - 1]['tokens'] <= budget:
+        keep_from -= 1
+        used_tokens += messages[keep_from]['tokens']
+    return keep_from
+
+
+def build_chat_history(chat_session):
+    """
+    Get the history summary and the recent turns of a chat session that fit
+    the token budget. No model call is made here, so the reply isn't held
+    up; older turns are folded by fold_chat_history after the reply.
+
+    Args:
+        chat_session: Chat session dict from get_chat_session
+
+    Returns:
+        tuple: (history summary, list of recent messages)
+    """
+    messages = get_chat_messages(chat_session['id'], chat_session['summarized_until'])
+    keep_from = chat_history_window(messages, CHAT_HISTORY_TOKEN_BUDGET)
+    return chat_session['history_summary'], messages[keep_from:]
+
+
+def fold_chat_history(chat_session):
+    """
+    Fold older turns into the session summary once the history is over budget
+
+    Runs after the reply has been stored. Turns are folded until the rest
+    fit CHAT_HISTORY_FOLD_TARGET, so the summary call runs every few turns.
+    If it fails the previous summary is kept and folding is retried after
+    the next turn.
+
+    Args:
+        chat_session: Chat session dict from get_chat_session
+    """
+    messages = get_chat_messages(chat_session['id'], chat_session['summarized_until'])
+    if chat_history_window(messages, CHAT_HISTORY_TOKEN_BUDGET) == 0:
+        return
+
+    fold_until = chat_history_window(messages, CHAT_HISTORY_FOLD_TARGET)
+    overflow = messages[:fold_until]
+    try:
+        summary = summarize_chat_history(chat_session['history_summary'], overflow)
+    except Exception as e:
+        print(f"[Chat] History summary failed, keeping previous summary: {str(e)}")
+        return
+
+    update_chat_summary(chat_session['id'], summary, overflow[-1]['id'])
+
+
+def get_chat_owner():
+    """
+    Get the owner key of the current user's chat sessions
+
+    Logged-in users own sessions by username. Anonymous users get a random
+    token kept in their session cookie, so chat session IDs (sequential
+    integers) can't be used to resume someone else's conversation.
+    """
+    if session.get('username'):
+        return session['username']
+    if 'chat_token' not in session:
+        session['chat_token'] = secrets.token_urlsafe(24)
+    return f"anon:{session['chat_token']}"
+
+
+def prepare_chat_turn(data, username, owner):
+    """
+    Validate a chat request and prepare the model input for it
+
+    Resumes the chat session (or starts one with the context built once),
+    tries the local query engine, and otherwise assembles the prompt from
+    the cached context, the history summary and the recent turns.
+
+    Args:
+        data: Request JSON body
+        username: Logged-in username (empty if anonymous)
+        owner: Chat session owner key from get_chat_owner
+
+    Returns:
+        tuple: (turn dict, None) on success, (None, (error message, status code)) otherwise
+    """
+    if not data or 'message' not in data:
+        return None, ("Message is required", 400)
+
+    user_message = data['message'].strip()
+
+    if not user_message:
+        return None, ("Message cannot be empty", 400)
+
+    # Resume the chat session, or start one with the context built once
+    if data.get('session_id'):
+        chat_session = get_chat_session(data['session_id'], owner)
+        if not chat_session:
+            return None, ("Chat session not found", 404)
+    else:
+        analysis_id = data.get('analysis_id')
+        if analysis_id:
+            detail = get_analysis_detail(analysis_id, username)
+            if not detail:
+                return None, ("Analysis not found", 404)
+            context_info = build_chat_context(detail)
+        else:
+            context_info = build_chat_context(data.get('context'))
+        session_id = create_chat_session(owner, analysis_id, context_info)
+        chat_session = get_chat_session(session_id, owner)
+
+    turn = {
+        'session': chat_session,
+        'user_message': user_message,
+        'local_reply': None,
+        'messages': None
+    }
+
+    # Lookups and sums are answered from stored transactions without an LLM call
+    if username:
+        turn['local_reply'] = answer_transaction_question(username, user_message, chat_session['analysis_id'])
+        if turn['local_reply']:
+            return turn, None
+
+    if not os.getenv('OPENAI_API_KEY'):
+        return None, ("OPENAI_API_KEY not configured", 500)
+
+    history_summary, recent_messages = build_chat_history(chat_session)
+
+    system_prompt = CHAT_SYSTEM_PROMPT + chat_session['context']
+    if history_summary:
+        system_prompt += f"\n\nSummary of the earlier conversation:\n{history_summary}\n"
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages += [{"role": msg['role'], "content": msg['content']} for msg in recent_messages]
+    messages.append({"role": "user", "content": user_message})
+    turn['messages'] = messages
+
+    return turn, None
+
+
+# ==========================================
+# Admission Control
+# ==========================================
+
+# Per-endpoint limits on OpenAI-backed work (env overrides for deployment sizing).
+# Limits apply per server process: with N workers the totals are N times these.
+# concurrency - requests served at once
+# queue       - requests allowed to wait for a slot, beyond that 429 right away
+# per_user    - waiting requests allowed per user, so one user can't fill the queue
+# timeout     - seconds a request may wait before it gets a 429
+ADMISSION_LIMITS = {
+    'upload': {
+        'concurrency': int(os.getenv('UPLOAD_CONCURRENCY', 4)),
+        'queue': int(os.getenv('UPLOAD_QUEUE', 8)),
+        'per_user': 2,
+        'timeout': 60
+    },
+    'chat': {
+        'concurrency': int(os.getenv('CHAT_CONCURRENCY', 8)),
+        'queue': int(os.getenv('CHAT_QUEUE', 32)),
+        'per_user': 4,
+        'timeout': 20
+    }
+}
+
+# Initial guess of seconds per request, refined from measured service times
+ADMISSION_DEFAULT_SECONDS = {'upload': 20.0, 'chat': 3.0}
+
+admission_lock = threading.Condition()
+admission_state = {
+    endpoint: {
+        'active': 0,
+        'active_by_user': {},
+        'waiting': [],
+        'grants': 0,
+        'last_granted': {},
+        'rejected': 0,
+        'timed_out': 0,
+        'avg_seconds': ADMISSION_DEFAULT_SECONDS[endpoint]
+    }
+    for endpoint in ADMISSION_LIMITS
+}
+
+
+def grant_waiting_slots(endpoint):
+    """
+    Hand free slots to waiting requests (caller holds admission_lock)
+
+    Slots rotate round-robin over the users with waiting requests: the
+    next slot goes to the user granted one least recently (users not yet
+    served first), earliest arrival first, so a user with a burst of
+    uploads takes turns with everyone else instead of going first.
+    """
+    state = admission_state[endpoint]
+    while state['waiting'] and state['active'] < ADMISSION_LIMITS[endpoint]['concurrency']:
+        waiter = min(state['waiting'], key=lambda w: (state['last_granted'].get(w['user'], 0), w['arrived']))
+        state['waiting'].remove(waiter)
+        state['active'] += 1
+        state['active_by_user'][waiter['user']] = state['active_by_user'].get(waiter['user'], 0) + 1
+        state['grants'] += 1
+        state['last_granted'][waiter['user']] = state['grants']
+        waiter['granted'] = True
+    admission_lock.notify_all()
+
+
+def forget_idle_user(state, user):
+    """Drop the turn of a user with nothing in flight or queued (caller holds admission_lock)"""
+    if user not in state['active_by_user'] and not any(w['user'] == user for w in state['waiting']):
+        state['last_granted'].pop(user, None)
+
+
+def acquire_slot(endpoint, user):
+    """
+    Wait for a free slot on an endpoint
+
+    Returns:
+        bool: True if a slot was granted, False if the request should get a 429
+    """
+    limits = ADMISSION_LIMITS[endpoint]
+    state = admission_state[endpoint]
+
+    with admission_lock:
+        # A free slot with nobody waiting is granted right away
+        if not state['waiting'] and state['active'] < limits['concurrency']:
+            state['active'] += 1
+            state['active_by_user'][user] = state['active_by_user'].get(user, 0) + 1
+            state['grants'] += 1
+            state['last_granted'][user] = state['grants']
+            return True
+
+        queued_by_user = sum(1 for w in state['waiting'] if w['user'] == user)
+        if len(state['waiting']) >= limits['queue'] or queued_by_user >= limits['per_user']:
+            state['rejected'] += 1
+            return False
+
+        waiter = {'user': user, 'arrived': time.monotonic(), 'granted': False}
+        state['waiting'].append(waiter)
+        grant_waiting_slots(endpoint)
+
+        deadline = waiter['arrived'] + limits['timeout']
+        while not waiter['granted']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                state['waiting'].remove(waiter)
+                state['timed_out'] += 1
+                forget_idle_user(state, user)
+                return False
+            admission_lock.wait(remaining)
+
+    return True
+
+
+def release_slot(endpoint, user, started):
+    """Free an endpoint slot and record how long the request held it"""
+    state = admission_state[endpoint]
+
+    with admission_lock:
+        state['active'] -= 1
+        state['active_by_user'][user] -= 1
+        if not state['active_by_user'][user]:
+            del state['active_by_user'][user]
+        forget_idle_user(state, user)
+
+        # Exponential moving average of service time, used for Retry-After
+        state['avg_seconds'] = 0.8 * state['avg_seconds'] + 0.2 * (time.monotonic() - started)
+
+        grant_waiting_slots(endpoint)
+
+
+def retry_after_seconds(endpoint):
+    """Estimate when a rejected request could get a slot"""
+    limits = ADMISSION_LIMITS[endpoint]
+    state = admission_state[endpoint]
+    backlog = len(state['waiting']) + 1
+    return max(1, int(state['avg_seconds'] * backlog / limits['concurrency'] + 0.999))
+
+
+def admission_controlled(endpoint):
+    """
+    Route decorator that limits concurrency of an endpoint
+
+    Requests wait in a bounded queue that takes turns between users; when the
+    queue is full (or the wait times out) they get a 429 with Retry-After.
+    For streamed responses the slot is held until the stream is closed.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Anonymous users are told apart by their session-cookie token, since
+            # behind a load balancer they all share one remote address
+            user = get_chat_owner()
+
+            if not acquire_slot(endpoint, user):
+                retry_after = retry_after_seconds(endpoint)
+                print(f"[Busy] Rejected /{endpoint} for {user}, retry after {retry_after}s")
+                response = jsonify({
+                    "error": f"Server is busy. Please try again in {retry_after} seconds.",
+                    "retry_after": retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+
+            started = time.monotonic()
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except Exception:
+                release_slot(endpoint, user, started)
+                raise
+
+            if response.is_streamed:
+                response.call_on_close(lambda: release_slot(endpoint, user, started))
+            else:
+                release_slot(endpoint, user, started)
+            return response
+        return wrapper
+    return decorator
+
+
+def get_admission_stats():
+    """
+    Get current queue depth and rejection counts per endpoint
+
+    Admission state lives in each server process, so these are the numbers
+    of the worker that answered the request.
+    """
+    with admission_lock:
+        return {
+            endpoint: {
+                'active': state['active'],
+                'queued': len(state['waiting']),
+                'concurrency_limit': ADMISSION_LIMITS[endpoint]['concurrency'],
+                'queue_limit': ADMISSION_LIMITS[endpoint]['queue'],
+                'rejected': state['rejected'],
+                'timed_out': state['timed_out']
+            }
+            for endpoint, state in admission_state.items()
+        }
+
+
 # ==========================================
 # Route Configuration
 # ==========================================
@@ -629,6 +2003,7 @@ def logout():
 
 
 @app.route('/upload', methods=['POST'])
+@admission_controlled('upload')
 def upload():
     """
     Handle file upload - supports PDF and images
@@ -667,23 +2042,33 @@ def upload():
 
             print(f"[PDF] Processing: {file.filename}")
 
+            # Optional password for encrypted PDFs (decrypted in memory, never stored)
+            password = request.form.get('password') or None
+
             # Check if PDF is encrypted
             file.seek(0)
             try:
-                if check_pdf_encrypted(file):
-                    return jsonify({"error": "PDF is encrypted. Please upload a screenshot instead."}), 400
+                if check_pdf_encrypted(file, password):
+                    if password:
+                        error = "Incorrect PDF password. Please try again or upload a screenshot instead."
+                    else:
+                        error = "PDF is encrypted. Please enter its password or upload a screenshot instead."
+                    return jsonify({"error": error, "encrypted": True, "password_incorrect": bool(password)}), 400
             except Exception as e:
                 if 'encrypt' in str(e).lower():
-                    return jsonify({"error": str(e)}), 400
+                    return jsonify({"error": str(e), "encrypted": True}), 400
 
-            # Extract PDF text
+            # Extract PDF text page by page
             file.seek(0)
-            pdf_text = extract_text_from_pdf(file)
-            print(f"[OK] PDF text extracted, length: {len(pdf_text)} chars")
+            pdf_content = extract_pages_from_pdf(file, password)
+            raw_tokens, raw_calls = estimate_parse_tokens(pdf_content['raw_pages'])
+            compact_tokens, compact_calls = estimate_parse_tokens(pdf_content['pages'], pdf_content['context'])
+            print(f"[OK] PDF text extracted, pages: {len(pdf_content['pages'])}, parse prompt tokens: "
+                  f"~{raw_tokens} raw ({raw_calls} calls) -> ~{compact_tokens} compact ({compact_calls} calls)")
 
-            # Use OpenAI to parse
+            # Use OpenAI to parse pages not seen in earlier uploads
             print("[API] Calling OpenAI to parse data...")
-            data = parse_text_with_openai(pdf_text)
+            data = parse_pdf_pages(pdf_content['pages'], session.get('username'), pdf_content['context'])
 
         # Validate data
         if not validate_data(data):
@@ -702,7 +2087,7 @@ def upload():
 
         # Save to database if user is logged in
         if 'username' in session:
-            save_analysis(session['username'], file.filename, data)
+            data['id'] = save_analysis(session['username'], file.filename, data)
             print(f"[DB] Analysis saved for user: {session['username']}")
 
         print("[OK] Processing complete")
@@ -721,7 +2106,9 @@ def health():
         "status": "ok",
         "timestamp": datetime.now().isoformat(),
         "api_configured": bool(os.getenv('OPENAI_API_KEY')),
-        "features": ["pdf", "image", "chat", "history"]
+        "features": ["pdf", "image", "chat", "history"],
+        "worker_pid": os.getpid(),  # Admission stats below are per worker process
+        "admission": get_admission_stats()
     })
 
 
@@ -748,6 +2135,31 @@ def history_detail(analysis_id):
     return jsonify(detail), 200
 
 
+@app.route('/history/<int:analysis_id>/series')
+def history_series(analysis_id):
+    """
+    Get the balance trend of an analysis, downsampled for charting
+    Query: points (resolution, default 300, max 2000)
+    Returns: { "labels": [...dates], "balances": [...], "total": original point count }
+    """
+    if 'username' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    transactions = get_analysis_transactions(analysis_id, session['username'])
+    if transactions is None:
+        return jsonify({"error": "Analysis not found"}), 404
+
+    points = min(max(request.args.get('points', 300, type=int), 3), 2000)
+    balances = [float(t.get('balance') or 0) for t in transactions]
+    indexes = downsample_lttb(balances, points)
+
+    return jsonify({
+        "labels": [transactions[i].get('date') for i in indexes],
+        "balances": [balances[i] for i in indexes],
+        "total": len(transactions)
+    }), 200
+
+
 @app.route('/history/<int:analysis_id>', methods=['DELETE'])
 def history_delete(analysis_id):
     """Delete an analysis record"""
@@ -759,67 +2171,118 @@ def history_delete(analysis_id):
 
 
 @app.route('/chat', methods=['POST'])
+@admission_controlled('chat')
 def chat():
     """
     AI Chatbot endpoint for financial assistance
-    Accepts: { "message": "user message", "context": optional financial data }
-    Returns: { "reply": "AI response" }
+    Accepts: { "message": "user message", "session_id": optional chat session,
+               "analysis_id": optional saved analysis, "context": optional financial data }
+    Returns: { "reply": "AI response", "session_id": chat session ID, "source": "local" or "llm" }
     """
 
-    if not os.getenv('OPENAI_API_KEY'):
-        return jsonify({"error": "OPENAI_API_KEY not configured"}), 500
-
     try:
-        data = request.get_json()
+        turn, error = prepare_chat_turn(request.get_json(), session.get('username', ''), get_chat_owner())
+        if error:
+            return jsonify({"error": error[0]}), error[1]
 
-        if not data or 'message' not in data:
-            return jsonify({"error": "Message is required"}), 400
+        chat_session = turn['session']
 
-        user_message = data['message'].strip()
-
-        if not user_message:
-            return jsonify({"error": "Message cannot be empty"}), 400
+        if turn['local_reply']:
+            reply, source = turn['local_reply'], 'local'
+        else:
+            # Call OpenAI API
+            response = get_openai_client().chat.completions.create(
+                model="gpt-4o-mini",
+                messages=turn['messages'],
+                temperature=0.7,
+                max_tokens=500
+            )
+            reply, source = response.choices[0].message.content, 'llm'
 
-        # Build context from financial data if available
-        context_info = ""
-        if 'context' in data and data['context']:
-            ctx = data['context']
-            context_info = f"""
+        add_chat_messages(chat_session['id'], [('user', turn['user_message']), ('assistant', reply)])
 
-User's Financial Data Context:
-- Opening Balance: ${ctx.get('summary', {}).get('start_balance', 'N/A')}
-- Closing Balance: ${ctx.get('summary', {}).get('end_balance', 'N/A')}
-- Total Income: ${ctx.get('summary', {}).get('total_income', 'N/A')}
-- Total Expenses: ${ctx.get('summary', {}).get('total_expense', 'N/A')}
-- Number of Transactions: {len(ctx.get('transactions', []))}
-- Top Spending Categories: {', '.join([f"{k}: ${v:.2f}" for k, v in sorted(ctx.get('categories', {}).items(), key=lambda x: x[1], reverse=True)[:3]])}
-"""
+        # Summarize older turns once the reply has been sent
+        response = jsonify({"reply": reply, "session_id": chat_session['id'], "source": source})
+        response.call_on_close(lambda: fold_chat_history(chat_session))
+        return response, 200
 
-        # Call OpenAI API
-        response = get_openai_client().chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": CHAT_SYSTEM_PROMPT + context_info
-                },
-                {
-                    "role": "user",
-                    "content": user_message
-                }
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
+    except Exception as e:
+        print(f"[Chat Error] {str(e)}")
+        return jsonify({"error": f"Chat failed: {str(e)}"}), 500
 
-        reply = response.choices[0].message.content
 
-        return jsonify({"reply": reply}), 200
+@app.route('/chat/stream', methods=['POST'])
+@admission_controlled('chat')
+def chat_stream():
+    """
+    Streaming variant of /chat using Server-Sent Events
+    Accepts: same body as /chat
+    Returns: text/event-stream of JSON events:
+             { "type": "start", "session_id", "source" }, { "type": "token", "content" },
+             then { "type": "done" } or { "type": "error", "error" }
+    """
 
+    try:
+        turn, error = prepare_chat_turn(request.get_json(), session.get('username', ''), get_chat_owner())
+        if error:
+            return jsonify({"error": error[0]}), error[1]
     except Exception as e:
         print(f"[Chat Error] {str(e)}")
         return jsonify({"error": f"Chat failed: {str(e)}"}), 500
 
+    chat_session = turn['session']
+
+    def sse_event(payload):
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def generate():
+        source = 'local' if turn['local_reply'] else 'llm'
+        yield sse_event({"type": "start", "session_id": chat_session['id'], "source": source})
+
+        if turn['local_reply']:
+            add_chat_messages(chat_session['id'], [('user', turn['user_message']), ('assistant', turn['local_reply'])])
+            yield sse_event({"type": "token", "content": turn['local_reply']})
+            yield sse_event({"type": "done"})
+            fold_chat_history(chat_session)
+            return
+
+        try:
+            stream = get_openai_client().chat.completions.create(
+                model="gpt-4o-mini",
+                messages=turn['messages'],
+                temperature=0.7,
+                max_tokens=500,
+                stream=True
+            )
+
+            parts = []
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    parts.append(content)
+                    yield sse_event({"type": "token", "content": content})
+
+            add_chat_messages(chat_session['id'], [('user', turn['user_message']), ('assistant', "".join(parts))])
+            yield sse_event({"type": "done"})
+
+            # Summarize older turns after the reply, not before the first token
+            fold_chat_history(chat_session)
+
+        except Exception as e:
+            print(f"[Chat Error] {str(e)}")
+            yield sse_event({"type": "error", "error": f"Chat failed: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+        }
+    )
+
 
 # ==========================================
 # Error Handlers
@@ -0,0 +1,51 @@
+"""
+FinSight Premium - Parse Prompt Size Benchmark
+Compares parse prompt tokens for raw page text vs compact layout rows
+
+Counts the full prompt of every parse call (template plus page content),
+as sent on a first upload when no page results are stored yet.
+
+Usage:
+1. Run: python benchmark_prompt_size.py statement1.pdf [statement2.pdf ...]
+2. Encrypted PDFs: python benchmark_prompt_size.py --password 010190 statement.pdf
+"""
+
+import argparse
+import sys
+
+from app_with_api import extract_pages_from_pdf, estimate_parse_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare raw and compact parse prompt sizes")
+    parser.add_argument('pdfs', nargs='+', help="Statement PDF files")
+    parser.add_argument('--password', help="Password for encrypted PDFs")
+    args = parser.parse_args()
+
+    total_raw = 0
+    total_compact = 0
+
+    print(f"{'File':<40} {'Pages':>5} {'Raw':>8} {'Calls':>5} {'Compact':>8} {'Calls':>5} {'Saved':>6}")
+    for path in args.pdfs:
+        with open(path, 'rb') as file:
+            pdf_content = extract_pages_from_pdf(file, args.password)
+
+        raw_tokens, raw_calls = estimate_parse_tokens(pdf_content['raw_pages'])
+        compact_tokens, compact_calls = estimate_parse_tokens(pdf_content['pages'], pdf_content['context'])
+        total_raw += raw_tokens
+        total_compact += compact_tokens
+
+        saved = 1 - compact_tokens / raw_tokens if raw_tokens else 0
+        print(f"{path[-40:]:<40} {len(pdf_content['pages']):>5} {raw_tokens:>8} {raw_calls:>5} "
+              f"{compact_tokens:>8} {compact_calls:>5} {saved:>6.0%}")
+
+    if len(args.pdfs) > 1:
+        saved = 1 - total_compact / total_raw if total_raw else 0
+        print(f"{'Total':<40} {'':>5} {total_raw:>8} {'':>5} {total_compact:>8} {'':>5} {saved:>6.0%}")
+
+    print("\nTokens are estimated at ~4 characters per token, including the parse prompt template of each call.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
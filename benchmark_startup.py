@@ -0,0 +1,206 @@
+"""
+FinSight Premium - Cold Start Benchmark
+Measures app import time and first-request latency in fresh processes
+
+Each run starts new Python interpreters in an empty temporary directory,
+so every run pays the full cold-start cost (imports and schema setup):
+- first /history request (database schema setup)
+- first /upload of a small fixture PDF (PDF stack and OpenAI client imports)
+- first /chat message, in its own process (OpenAI client import)
+
+OpenAI calls are stubbed after the real client is created, so the lazy
+imports are timed but no network requests are made.
+
+Usage:
+1. Run: python benchmark_startup.py
+2. Optional: python benchmark_startup.py --runs 10 --max-import-ms 300 --max-upload-ms 800
+   (exits with status 1 if a median exceeds its limit, for use in CI)
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Parse result returned by the stubbed model for the fixture statement
+FIXTURE_RESULT = {
+    "pages": [{
+        "page": 1,
+        "summary": {"start_balance": 100.0, "end_balance": 91.4, "total_income": 0.0, "total_expense": 8.6},
+        "transactions": [
+            {"date": "2025-12-03", "description": "PRIME SUPERMARKET", "amount": -8.6,
+             "balance": 91.4, "category": "Food & Dining"}
+        ]
+    }]
+}
+
+
+def make_fixture_pdf():
+    """Build a one-page statement PDF with a small transaction table"""
+    lines = [
+        (50, 760, "Statement Period: 01 Dec 2025 to 31 Dec 2025"),
+        (50, 730, "Date"), (110, 730, "Description"), (330, 730, "Withdrawal"), (490, 730, "Balance"),
+        (50, 715, "01 Dec"), (110, 715, "Balance Brought Forward"), (490, 715, "100.00"),
+        (50, 700, "03 Dec"), (110, 700, "PRIME SUPERMARKET"), (330, 700, "8.60"), (490, 700, "91.40")
+    ]
+    stream = "BT /F1 9 Tf " + " ".join(f"1 0 0 1 {x} {y} Tm ({text}) Tj" for x, y, text in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+    ]
+
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF"
+    return pdf.encode('latin-1')
+
+
+def stub_completion(**kwargs):
+    """Stand-in for chat.completions.create that answers instantly"""
+    content = json.dumps(FIXTURE_RESULT) if kwargs.get('response_format') else "Benchmark reply"
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def timed(call):
+    """Run call and return (result, elapsed ms)"""
+    start = time.perf_counter()
+    result = call()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def measure_in_process(scenario):
+    """
+    Measure one scenario in this (fresh) interpreter and print the timings as JSON
+
+    Args:
+        scenario: 'upload' (import, /history, /upload) or 'chat' (import, /chat)
+    """
+    sys.path.insert(0, APP_DIR)
+    app_module, import_ms = timed(lambda: __import__('app_with_api'))
+
+    # Keep the real lazy client creation (and its imports), only stub the API call
+    real_get_openai_client = app_module.get_openai_client
+
+    def get_stubbed_client():
+        client = real_get_openai_client()
+        client.chat.completions.create = stub_completion
+        return client
+
+    app_module.get_openai_client = get_stubbed_client
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['username'] = 'benchmark'
+
+    timings = {"import_ms": import_ms}
+    statuses = []
+
+    if scenario == 'upload':
+        response, timings["history_ms"] = timed(lambda: client.get('/history'))
+        statuses.append(response.status_code)
+
+        response, timings["upload_ms"] = timed(lambda: client.post(
+            '/upload',
+            data={'type': 'pdf', 'pdf': (io.BytesIO(make_fixture_pdf()), 'fixture.pdf')},
+            content_type='multipart/form-data'
+        ))
+        statuses.append(response.status_code)
+    else:
+        response, timings["chat_ms"] = timed(lambda: client.post(
+            '/chat', json={'message': 'Any tips for my budget?'}
+        ))
+        statuses.append(response.status_code)
+
+    timings["statuses"] = statuses
+    print(json.dumps(timings))
+
+
+def measure_once(scenario):
+    """
+    Measure one cold start of a scenario in a fresh interpreter
+
+    Returns:
+        dict: Timings in ms and the status codes of the requests
+    """
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'benchmark-key'))
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--measure', scenario],
+            cwd=work_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure FinSight cold-start latency")
+    parser.add_argument('--runs', type=int, default=5, help="Number of fresh processes to measure")
+    parser.add_argument('--max-import-ms', type=float, help="Fail if median import time exceeds this")
+    parser.add_argument('--max-first-request-ms', type=float, help="Fail if median first /history exceeds this")
+    parser.add_argument('--max-upload-ms', type=float, help="Fail if median first /upload exceeds this")
+    parser.add_argument('--max-chat-ms', type=float, help="Fail if median first /chat exceeds this")
+    parser.add_argument('--measure', choices=['upload', 'chat'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure_in_process(args.measure)
+        return 0
+
+    results = []
+    for _ in range(args.runs):
+        upload_run = measure_once('upload')
+        chat_run = measure_once('chat')
+        results.append({**upload_run, 'chat_ms': chat_run['chat_ms'],
+                        'statuses': upload_run['statuses'] + chat_run['statuses']})
+
+    failed = [status for r in results for status in r['statuses'] if status != 200]
+    if failed:
+        print(f"[ERROR] A first request returned status {failed[0]}")
+        return 1
+
+    medians = {key: statistics.median(r[key] for r in results)
+               for key in ('import_ms', 'history_ms', 'upload_ms', 'chat_ms')}
+
+    print(f"Runs:                    {args.runs}")
+    print(f"Import (median):         {medians['import_ms']:.1f} ms")
+    print(f"First /history (median): {medians['history_ms']:.1f} ms")
+    print(f"First /upload (median):  {medians['upload_ms']:.1f} ms")
+    print(f"First /chat (median):    {medians['chat_ms']:.1f} ms")
+
+    limits = [
+        ('import_ms', args.max_import_ms, "Import time"),
+        ('history_ms', args.max_first_request_ms, "First /history"),
+        ('upload_ms', args.max_upload_ms, "First /upload"),
+        ('chat_ms', args.max_chat_ms, "First /chat")
+    ]
+    exit_code = 0
+    for key, limit, label in limits:
+        if limit is not None and medians[key] > limit:
+            print(f"[FAIL] {label} above limit of {limit:.0f} ms")
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -258,12 +258,28 @@ function showStatus(message, type) {
     }
 }
 
+// === Unlock Encrypted PDF with Password === //
+async function unlockPDF(event) {
+    event.preventDefault();
+
+    const password = document.getElementById('pdfPassword').value;
+    if (!password || pendingFiles.length === 0) return;
+
+    document.getElementById('encryptedWarning').style.display = 'none';
+    showLoading(true);
+
+    await uploadFile(pendingFiles[0], 'pdf', password);
+}
+
 // === Upload File === //
-async function uploadFile(file, type) {
+async function uploadFile(file, type, password = null) {
     const formData = new FormData();
 
     if (type === 'pdf') {
         formData.append('pdf', file);
+        if (password) {
+            formData.append('password', password);
+        }
     } else {
         formData.append('image', file);
     }
@@ -292,8 +308,8 @@ async function uploadFile(file, type) {
             renderData(data);
         } else {
             // Check if PDF is encrypted
-            if (data.error && (data.error.includes('encrypt') || data.error.includes('Encrypt'))) {
-                showEncryptedWarning();
+            if (data.encrypted || (data.error && (data.error.includes('encrypt') || data.error.includes('Encrypt')))) {
+                showEncryptedWarning(data.password_incorrect);
             } else {
                 alert(data.error || 'Analysis failed. Please try again.');
                 resetUpload();
@@ -308,10 +324,15 @@ async function uploadFile(file, type) {
 }
 
 // === Show PDF Encrypted Warning === //
-function showEncryptedWarning() {
+function showEncryptedWarning(passwordIncorrect = false) {
     document.getElementById('uploadSection').style.display = 'none';
     document.getElementById('previewSection').style.display = 'none';
     document.getElementById('encryptedWarning').style.display = 'flex';
+
+    const passwordInput = document.getElementById('pdfPassword');
+    passwordInput.value = '';
+    document.getElementById('passwordError').textContent = passwordIncorrect ? 'Incorrect password. Please try again.' : '';
+    passwordInput.focus();
 }
 
 // === Show/Hide Loading State === //
@@ -324,6 +345,7 @@ function resetUpload() {
     pendingFiles = [];
     currentReportData = null;
     currentReportMarkdown = null;
+    chatSessionId = null;
 
     document.getElementById('uploadSection').style.display = 'flex';
     document.getElementById('previewSection').style.display = 'none';
@@ -331,10 +353,14 @@ function resetUpload() {
     document.getElementById('dataSection').style.display = 'none';
     document.getElementById('fileInput').value = '';
     document.getElementById('uploadStatus').textContent = '';
+    document.getElementById('pdfPassword').value = '';
 }
 
 // === Render All Data === //
 function renderData(data) {
+    // New statement data starts a new chat session
+    chatSessionId = null;
+
     // Show data section
     document.getElementById('dataSection').style.display = 'block';
 
@@ -360,48 +386,234 @@ function renderSummary(summary) {
 }
 
 // === Render Transaction Table === //
+// Large statements are windowed: only the rows in view (plus a margin) are in
+// the DOM and are recycled as the table scrolls, while two spacer rows stand
+// in for the rest so the scrollbar keeps its full length.
+const TABLE_WINDOW_THRESHOLD = 100;
+const TABLE_WINDOW_OVERSCAN = 10;
+const TABLE_WINDOW_HEIGHT = 640;
+let tableState = null;
+
 function renderTransactionTable(transactions) {
     const tbody = document.getElementById('transactionTableBody');
+    const container = tbody.closest('.table-responsive');
     tbody.innerHTML = '';
+    container.scrollTop = 0;
+    container.onscroll = null;
+    tableState = null;
+
+    const windowed = transactions.length > TABLE_WINDOW_THRESHOLD;
+    container.classList.toggle('table-windowed', windowed);
+
+    if (!windowed) {
+        const fragment = document.createDocumentFragment();
+        transactions.forEach(transaction => fragment.appendChild(createTransactionRow(transaction)));
+        tbody.appendChild(fragment);
+        return;
+    }
+
+    const topSpacer = createSpacerRow();
+    const bottomSpacer = createSpacerRow();
+    tbody.append(topSpacer, bottomSpacer);
+
+    const state = {
+        transactions: transactions,
+        container: container,
+        tbody: tbody,
+        topSpacer: topSpacer,
+        bottomSpacer: bottomSpacer,
+        rows: [],
+        rowHeight: 53,
+        start: -1,
+        frame: null
+    };
+    tableState = state;
+
+    // Re-render at most once per frame while scrolling
+    container.onscroll = function() {
+        if (state.frame) return;
+        state.frame = requestAnimationFrame(() => {
+            state.frame = null;
+            if (state === tableState) renderTableWindow();
+        });
+    };
+
+    renderTableWindow();
+}
+
+// === Render Visible Window of Transaction Rows === //
+function renderTableWindow() {
+    const state = tableState;
+    const { container, transactions } = state;
 
-    transactions.forEach(transaction => {
+    const headerHeight = container.querySelector('thead')?.offsetHeight || 0;
+    const scrollTop = Math.max(container.scrollTop - headerHeight, 0);
+    const visibleRows = Math.ceil((container.clientHeight || TABLE_WINDOW_HEIGHT) / state.rowHeight);
+
+    const start = Math.max(Math.floor(scrollTop / state.rowHeight) - TABLE_WINDOW_OVERSCAN, 0);
+    const end = Math.min(start + visibleRows + 2 * TABLE_WINDOW_OVERSCAN, transactions.length);
+    if (start === state.start) return;
+    state.start = start;
+
+    // Reuse the existing rows, only growing or shrinking the pool when the window size changes
+    while (state.rows.length < end - start) {
         const row = document.createElement('tr');
+        state.tbody.insertBefore(row, state.bottomSpacer);
+        state.rows.push(row);
+    }
+    while (state.rows.length > end - start) {
+        state.rows.pop().remove();
+    }
+    state.rows.forEach((row, index) => fillTransactionRow(row, transactions[start + index]));
 
-        const amountClass = transaction.amount > 0 ? 'amount-positive' : 'amount-negative';
-        const amountDisplay = formatAmountWithSign(transaction.amount);
-        const category = transaction.category || 'Other';
+    state.topSpacer.style.height = `${start * state.rowHeight}px`;
+    state.bottomSpacer.style.height = `${(transactions.length - end) * state.rowHeight}px`;
 
-        row.innerHTML = `
-            <td>${transaction.date}</td>
-            <td>${transaction.description}</td>
-            <td><span class="category-badge" data-category="${category}">${category}</span></td>
-            <td class="text-end ${amountClass}">${amountDisplay}</td>
-            <td class="text-end">${formatCurrency(transaction.balance)}</td>
-        `;
+    // Correct the estimated row height once a real row has been laid out
+    const measured = state.rows[0]?.getBoundingClientRect().height;
+    if (measured && Math.abs(measured - state.rowHeight) > 0.5) {
+        state.rowHeight = measured;
+        state.start = -1;
+        renderTableWindow();
+    }
+}
 
-        tbody.appendChild(row);
-    });
+// === Create Spacer Row for Windowed Table === //
+function createSpacerRow() {
+    const row = document.createElement('tr');
+    row.className = 'table-spacer';
+    row.setAttribute('aria-hidden', 'true');
+    row.innerHTML = '<td colspan="5"></td>';
+    return row;
+}
+
+// === Create Transaction Table Row === //
+function createTransactionRow(transaction) {
+    const row = document.createElement('tr');
+    fillTransactionRow(row, transaction);
+    return row;
+}
+
+// === Fill Transaction Table Row === //
+function fillTransactionRow(row, transaction) {
+    const amountClass = transaction.amount > 0 ? 'amount-positive' : 'amount-negative';
+    const amountDisplay = formatAmountWithSign(transaction.amount);
+    const category = transaction.category || 'Other';
+
+    row.innerHTML = `
+        <td>${transaction.date}</td>
+        <td>${transaction.description}</td>
+        <td><span class="category-badge" data-category="${category}">${category}</span></td>
+        <td class="text-end ${amountClass}">${amountDisplay}</td>
+        <td class="text-end">${formatCurrency(transaction.balance)}</td>
+    `;
 }
 
 // === Render Charts === //
 function renderCharts(data) {
-    renderTrendChart(data.transactions);
+    renderTrendChart(data.transactions, data.id);
     renderCategoryChart(data.categories);
 }
 
 // === Render Balance Trend Chart === //
-function renderTrendChart(transactions) {
-    const ctx = document.getElementById('trendChart').getContext('2d');
+// Above this many points the series is downsampled: saved analyses fetch it
+// from the server, unsaved results are downsampled in the browser
+const TREND_CHART_MAX_POINTS = 300;
+let trendChartRenderId = 0;
+
+// === Downsample Series (Largest-Triangle-Three-Buckets) === //
+// Same algorithm as downsample_lttb on the server; returns the kept indexes
+function downsampleLTTB(values, threshold) {
+    const count = values.length;
+    if (threshold >= count || threshold < 3) {
+        return values.map((_, i) => i);
+    }
+
+    const selected = [0];
+    const bucketSize = (count - 2) / (threshold - 2);
+    let previous = 0;
+
+    for (let bucket = 0; bucket < threshold - 2; bucket++) {
+        const start = Math.floor(bucket * bucketSize) + 1;
+        const end = Math.floor((bucket + 1) * bucketSize) + 1;
+
+        // Average of the next bucket (or the last point) is the third triangle corner
+        let nextStart = end;
+        let nextEnd = Math.min(Math.floor((bucket + 2) * bucketSize) + 1, count);
+        if (nextStart >= nextEnd) {
+            nextStart = count - 1;
+            nextEnd = count;
+        }
+        const avgX = (nextStart + nextEnd - 1) / 2;
+        let avgY = 0;
+        for (let i = nextStart; i < nextEnd; i++) avgY += values[i];
+        avgY /= nextEnd - nextStart;
+
+        let bestIndex = start;
+        let bestArea = -1;
+        for (let i = start; i < end; i++) {
+            const area = Math.abs((previous - avgX) * (values[i] - values[previous]) -
+                                  (previous - i) * (avgY - values[previous]));
+            if (area > bestArea) {
+                bestIndex = i;
+                bestArea = area;
+            }
+        }
+
+        selected.push(bestIndex);
+        previous = bestIndex;
+    }
+
+    selected.push(count - 1);
+    return selected;
+}
+
+async function renderTrendChart(transactions, analysisId = null) {
+    const renderId = ++trendChartRenderId;
+    const canvas = document.getElementById('trendChart');
+    const ctx = canvas.getContext('2d');
+
+    // Extract date and balance data
+    let labels = transactions.map(t => t.date);
+    let balances = transactions.map(t => t.balance);
+
+    if (transactions.length > TREND_CHART_MAX_POINTS) {
+        // About one point per two pixels of chart width keeps the line's shape
+        const points = Math.min(Math.max(Math.round(canvas.clientWidth / 2), 50), TREND_CHART_MAX_POINTS);
+        let downsampled = false;
+
+        if (analysisId) {
+            try {
+                const response = await fetch(`/history/${analysisId}/series?points=${points}`);
+                if (response.ok) {
+                    const series = await response.json();
+                    labels = series.labels;
+                    balances = series.balances;
+                    downsampled = true;
+                }
+            } catch (error) {
+                console.error('Trend series error:', error);
+            }
+        }
+
+        // Unsaved results (or a failed fetch) are downsampled from the rows in the browser
+        if (!downsampled) {
+            const indexes = downsampleLTTB(balances.map(b => Number(b) || 0), points);
+            labels = indexes.map(i => labels[i]);
+            balances = indexes.map(i => balances[i]);
+        }
+    }
+
+    // A newer chart was requested while the series was loading
+    if (renderId !== trendChartRenderId) return;
+
+    const isDense = balances.length > TREND_CHART_MAX_POINTS;
 
     // Destroy old chart
     if (trendChart) {
         trendChart.destroy();
     }
 
-    // Extract date and balance data
-    const labels = transactions.map(t => t.date);
-    const balances = transactions.map(t => t.balance);
-
     trendChart = new Chart(ctx, {
         type: 'line',
         data: {
@@ -412,9 +624,9 @@ function renderTrendChart(transactions) {
                 borderColor: 'rgb(99, 102, 241)',
                 backgroundColor: 'rgba(99, 102, 241, 0.1)',
                 borderWidth: 2.5,
-                tension: 0.4,
+                tension: isDense ? 0 : 0.4,
                 fill: true,
-                pointRadius: 4,
+                pointRadius: isDense ? 0 : 4,
                 pointHoverRadius: 6,
                 pointBackgroundColor: 'rgb(99, 102, 241)',
                 pointBorderColor: '#fff',
@@ -861,6 +1073,7 @@ function formatAmountWithSign(amount) {
 
 let isChatOpen = false;
 let isChatLoading = false;
+let chatSessionId = null;  // Server-side chat session (keeps history and context)
 
 // === Toggle Chat Window === //
 function toggleChat() {
@@ -913,34 +1126,39 @@ async function sendChatMessage() {
     const loadingId = addChatLoading();
 
     try {
-        // Prepare context if financial data is available
-        const context = currentReportData ? {
+        // Saved analyses are referenced by ID; the server builds and caches the context.
+        // Unsaved results only send the compact summary once, when the session starts.
+        const analysisId = currentReportData && currentReportData.id ? currentReportData.id : null;
+        const context = !chatSessionId && currentReportData && !analysisId ? {
             summary: currentReportData.summary,
             categories: currentReportData.categories,
-            transactions: currentReportData.transactions
+            transaction_count: currentReportData.transactions.length
         } : null;
 
-        // Send request to backend
-        const response = await fetch('/chat', {
+        // Send request to backend, reply tokens arrive as Server-Sent Events
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
                 message: message,
+                session_id: chatSessionId,
+                analysis_id: analysisId,
                 context: context
             })
         });
 
-        const data = await response.json();
-
-        // Remove loading indicator
-        removeChatLoading(loadingId);
-
-        if (response.ok) {
-            addChatMessage(data.reply, 'bot');
-        } else {
+        if (response.status === 429) {
+            // Server is at capacity, it says when to retry
+            const retryAfter = response.headers.get('Retry-After') || 'a few';
+            removeChatLoading(loadingId);
+            addChatMessage(`I'm handling a lot of questions right now. Please try again in ${retryAfter} seconds.`, 'bot', true);
+        } else if (!response.ok) {
+            removeChatLoading(loadingId);
             addChatMessage('Sorry, I encountered an error. Please try again.', 'bot', true);
+        } else {
+            await readChatStream(response, loadingId);
         }
 
     } catch (error) {
@@ -952,6 +1170,51 @@ async function sendChatMessage() {
     isChatLoading = false;
 }
 
+// === Read Streamed Chat Reply === //
+async function readChatStream(response, loadingId) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+    let messageDiv = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const event of events) {
+            if (!event.startsWith('data: ')) continue;
+            const payload = JSON.parse(event.slice(6));
+
+            if (payload.type === 'start') {
+                chatSessionId = payload.session_id;
+            } else if (payload.type === 'token') {
+                reply += payload.content;
+                if (!messageDiv) {
+                    removeChatLoading(loadingId);
+                    messageDiv = addChatMessage(reply, 'bot');
+                } else {
+                    updateChatMessage(messageDiv, reply);
+                }
+            } else if (payload.type === 'error') {
+                console.error('Chat error:', payload.error);
+                removeChatLoading(loadingId);
+                if (messageDiv) messageDiv.remove();
+                addChatMessage('Sorry, I encountered an error. Please try again.', 'bot', true);
+                return;
+            }
+        }
+    }
+
+    removeChatLoading(loadingId);
+}
+
 // === Add Message to Chat === //
 function addChatMessage(content, sender, isError = false) {
     const messagesContainer = document.getElementById('chatMessages');
@@ -979,6 +1242,21 @@ function addChatMessage(content, sender, isError = false) {
 
     // Scroll to bottom
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
+
+    return messageDiv;
+}
+
+// === Update Bot Message While It Streams === //
+function updateChatMessage(messageDiv, content) {
+    const messagesContainer = document.getElementById('chatMessages');
+    const isAtBottom = messagesContainer.scrollHeight - messagesContainer.scrollTop - messagesContainer.clientHeight < 40;
+
+    messageDiv.querySelector('.message-content').innerHTML = formatChatMessage(content);
+
+    // Keep following the reply unless the user scrolled up
+    if (isAtBottom) {
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
 }
 
 // === Add Loading Indicator === //
@@ -0,0 +1,68 @@
+"""
+Tests for serialize_statement_layout on word-coordinate input
+
+Run: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_with_api import serialize_statement_layout
+
+
+class FakePage:
+    """Stand-in for a pdfplumber page built from (x, top, text) phrases"""
+
+    def __init__(self, phrases):
+        self.words = []
+        for x, top, text in phrases:
+            for part in text.split():
+                self.words.append({'text': part, 'x0': x, 'x1': x + 5 * len(part), 'top': top})
+                x += 5 * len(part) + 3
+
+    def extract_words(self):
+        return self.words
+
+
+def test_table_header_below_summary_box_keeps_debit_and_credit_columns():
+    page = FakePage([
+        (50, 80, "Statement Period: 01 Jan 2025 to 31 Jan 2025"),
+        (50, 100, "Opening Balance"), (180, 100, "Total Debits"), (300, 100, "Total Credits"), (420, 100, "Closing Balance"),
+        (50, 115, "2,000.00"), (180, 115, "5.00"), (300, 115, "100.00"), (420, 115, "2,095.00"),
+        (50, 150, "Date"), (110, 150, "Description"), (300, 150, "Debit"), (380, 150, "Credit"), (460, 150, "Balance"),
+        (50, 165, "02 Jan"), (110, 165, "COFFEE"), (300, 165, "5.00"), (460, 165, "1,995.00"),
+        (50, 180, "03 Jan"), (110, 180, "REFUND"), (380, 180, "100.00"), (460, 180, "2,095.00"),
+    ])
+
+    layout = serialize_statement_layout([page])
+    rows = layout['pages'][0].split('\n')
+
+    assert "Date|Description|Debit|Credit|Balance" in rows
+    assert "02 Jan|COFFEE|5.00||1,995.00" in rows
+    assert "03 Jan|REFUND||100.00|2,095.00" in rows
+    assert layout['context'] == "Statement Period: 01 Jan 2025 to 31 Jan 2025"
+
+
+def test_continuation_page_reuses_columns_and_keeps_wrapped_lines():
+    header = [(50, 100, "Date"), (110, 100, "Description"), (300, 100, "Debit"), (380, 100, "Credit"), (460, 100, "Balance")]
+    first_page = FakePage(header + [
+        (50, 115, "02 Jan"), (110, 115, "COFFEE"), (300, 115, "5.00"), (460, 115, "1,995.00"),
+        (110, 130, "CARD 1234 VISA"),
+        (50, 145, "03 Jan"), (110, 145, "GRAB"), (300, 145, "10.00"), (460, 145, "1,985.00"),
+    ])
+    second_page = FakePage([
+        (50, 115, "04 Jan"), (110, 115, "SALARY"), (380, 115, "3,000.00"), (460, 115, "4,985.00"),
+        (110, 130, "CARD 1234 VISA"),
+        (50, 145, "05 Jan"), (110, 145, "GRAB"), (300, 145, "10.00"), (460, 145, "4,975.00"),
+    ])
+
+    pages = serialize_statement_layout([first_page, second_page])['pages']
+
+    assert "|CARD 1234 VISA" in pages[0].split('\n')
+    assert pages[1].split('\n') == [
+        "04 Jan|SALARY||3,000.00|4,985.00",
+        "|CARD 1234 VISA",
+        "05 Jan|GRAB|10.00||4,975.00",
+    ]